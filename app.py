@@ -1,37 +1,79 @@
+import hashlib
+import hmac
 import os
+import re
+from collections import deque
+
 import streamlit as st
-import google.genai as genai
-from google.genai import errors as genai_errors
+
+# google-genai is imported lazily in configure_client/_get_client so the
+# login screen doesn't pay its cold-start cost for unauthenticated hits.
 
 # App configuration
 st.set_page_config(page_title="AI Tutor", page_icon="📚", layout="wide")
 
-# Password for authentication
+# Password for authentication; only a digest is kept for the comparison.
 CORRECT_PASSWORD = "Yannou5423!!"
+_PW_HASH = hashlib.sha256(CORRECT_PASSWORD.encode()).digest() if CORRECT_PASSWORD else None
+
+# Static copy rendered on every rerun; built once at import.
+GUIDED_INTRO = "Learn any topic step-by-step with a Socratic tutor approach."
+PRACTICE_INTRO = "Generate quizzes to test your knowledge on any topic."
+CHAT_INTRO = "Ask any question or discuss any topic with the AI."
+
+# Quiz format spec, assembled once at import rather than per click.
+_QUIZ_BLOCK = (
+    "Q{n}: [Question text]\n"
+    "A) [Option A]\n"
+    "B) [Option B]\n"
+    "C) [Option C]\n"
+    "D) [Option D]\n"
+    "Correct: [A/B/C/D]\n"
+    "Explanation: [Brief explanation]"
+)
+_QUIZ_TEMPLATE_TAIL = "\n\n".join(_QUIZ_BLOCK.format(n=i) for i in range(1, 6))
+
+# Matches one full question block in the quiz format requested from Gemini.
+QUIZ_RE = re.compile(
+    r"Q\d+:\s*(?P<question>.+?)\s*\n"
+    r"A\)\s*(?P<A>.+?)\s*\n"
+    r"B\)\s*(?P<B>.+?)\s*\n"
+    r"C\)\s*(?P<C>.+?)\s*\n"
+    r"D\)\s*(?P<D>.+?)\s*\n"
+    r"Correct:\s*(?P<correct>[ABCD])\s*\n"
+    r"Explanation:\s*(?P<explanation>.+?)(?=\nQ\d+:|\Z)",
+    re.DOTALL,
+)
+
+
+@st.cache_resource(show_spinner=False)
+def _get_client(api_key):
+    """Build a Gemini client once per API key and reuse it across reruns."""
+    from google import genai
+
+    return genai.Client(api_key=api_key)
 
 
 def init_session_state():
     """Initialize session state variables."""
-    if "authenticated" not in st.session_state:
-        st.session_state.authenticated = False
-    if "api_key" not in st.session_state:
-        st.session_state.api_key = None
-    if "api_key_entry" not in st.session_state:
-        st.session_state.api_key_entry = ""
-    if "client" not in st.session_state:
-        st.session_state.client = None
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-    if "guided_history" not in st.session_state:
-        st.session_state.guided_history = []
-    if "guided_topic" not in st.session_state:
-        st.session_state.guided_topic = ""
-    if "quiz_questions" not in st.session_state:
-        st.session_state.quiz_questions = None
-    if "quiz_submitted" not in st.session_state:
-        st.session_state.quiz_submitted = False
-    if "user_answers" not in st.session_state:
-        st.session_state.user_answers = {}
+    defaults = {
+        "authenticated": False,
+        "api_key": None,
+        "api_key_entry": "",
+        "client": None,
+        # Only the most recent turns are ever shown; the deque bounds
+        # per-session memory instead of growing with conversation length.
+        "chat_history": deque(maxlen=20),
+        "guided_history": [],
+        "guided_topic": "",
+        "guided_chat": None,
+        "chat_session": None,
+        "quiz_questions": None,
+        "quiz_submitted": False,
+        "user_answers": {},
+    }
+    for key, value in defaults.items():
+        st.session_state.setdefault(key, value)
 
 
 def reset_api_state_with_error(message, details=None, clear_entry=True):
@@ -48,8 +90,10 @@ def reset_api_state_with_error(message, details=None, clear_entry=True):
 def configure_client():
     """Configure the Gemini client once the user provides an API key."""
     if st.session_state.api_key:
+        from google.genai import errors as genai_errors
+
         try:
-            st.session_state.client = genai.Client(api_key=st.session_state.api_key)
+            st.session_state.client = _get_client(st.session_state.api_key)
         except genai_errors.ClientError as e:
             reset_api_state_with_error(
                 "Failed to initialize Gemini client. Please re-enter a valid API key.",
@@ -75,7 +119,10 @@ def login_screen():
     password = st.text_input("Password", type="password")
     
     if st.button("Login"):
-        if password == CORRECT_PASSWORD:
+        # Constant-time digest comparison avoids leaking prefix length.
+        if _PW_HASH and hmac.compare_digest(
+            hashlib.sha256(password.encode()).digest(), _PW_HASH
+        ):
             st.session_state.authenticated = True
             st.rerun()
         else:
@@ -85,7 +132,7 @@ def login_screen():
 def guided_learning():
     """Guided Learning mode - Socratic tutor."""
     st.header("📖 Guided Learning")
-    st.markdown("Learn any topic step-by-step with a Socratic tutor approach.")
+    st.markdown(GUIDED_INTRO)
     
     if not st.session_state.client:
         st.error("Client is not initialized. Please enter a valid API key to continue.")
@@ -97,7 +144,8 @@ def guided_learning():
     if topic != st.session_state.guided_topic:
         st.session_state.guided_topic = topic
         st.session_state.guided_history = []
-    
+        st.session_state.guided_chat = None
+
     if st.button("Start Learning") and topic:
         st.session_state.guided_history = []
         system_prompt = f"""You are a Socratic tutor. The student wants to learn about: {topic}
@@ -106,54 +154,57 @@ Your task is to:
 1. Explain the topic in small, digestible steps
 2. After each explanation, ask the student a question to verify their understanding
 3. Wait for their response before moving to the next concept
-4. If they answer incorrectly, gently guide them to the correct understanding
-5. Be encouraging and supportive
+4. If they answer incorrectly, praise what was right and gently guide them to the correct understanding
+5. If they answer correctly, praise them and move to the next concept with a new question
+6. Keep explanations concise and be encouraging and supportive
 
 Start by introducing the topic and explaining the first concept, then ask a question."""
-        
+
         try:
-            response = st.session_state.client.models.generate_content(
-                model='gemini-2.0-flash-exp',
-                contents=system_prompt
+            st.session_state.guided_chat = st.session_state.client.chats.create(
+                model='gemini-2.0-flash-exp'
             )
-            st.session_state.guided_history.append({"role": "assistant", "content": response.text})
+            stream = st.session_state.guided_chat.send_message_stream(system_prompt)
+            placeholder = st.empty()
+            with placeholder.container(), st.chat_message("assistant"):
+                full_text = st.write_stream(chunk.text for chunk in stream if chunk.text)
+            # The history loop below repaints the final text, so drop the placeholder.
+            placeholder.empty()
+            st.session_state.guided_history.append({"role": "assistant", "content": full_text})
         except Exception as e:
             st.error(f"Error generating response: {str(e)}")
     
-    # Display conversation history
-    for message in st.session_state.guided_history:
-        if message["role"] == "assistant":
-            st.markdown(f"**🤖 Tutor:** {message['content']}")
-        else:
-            st.markdown(f"**👤 You:** {message['content']}")
-    
+    _guided_conversation()
+
+
+@st.fragment
+def _render_history(history):
+    """Render a message history; reruns independently of the input widgets."""
+    for message in history:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+
+@st.fragment
+def _guided_conversation():
+    """Conversation area for Guided Learning; sends rerun only this fragment."""
+    _render_history(st.session_state.guided_history)
+
     # User response input
-    if st.session_state.guided_history:
-        user_response = st.text_input("Your response:", key="guided_response")
-        
-        if st.button("Send Response") and user_response:
+    if st.session_state.guided_history and st.session_state.guided_chat:
+        if user_response := st.chat_input("Your response:"):
             st.session_state.guided_history.append({"role": "user", "content": user_response})
-            
-            # Build conversation context
-            conversation = f"Topic: {st.session_state.guided_topic}\n\n"
-            for msg in st.session_state.guided_history:
-                role = "Tutor" if msg["role"] == "assistant" else "Student"
-                conversation += f"{role}: {msg['content']}\n\n"
-            
-            continuation_prompt = f"""{conversation}
-
-Continue as a Socratic tutor. Based on the student's response:
-- If correct, praise them and move to the next concept with a new question
-- If incorrect, gently guide them toward understanding
-- Keep explanations concise and ask questions to verify understanding"""
-            
+
+            with st.chat_message("user"):
+                st.markdown(user_response)
+
             try:
-                response = st.session_state.client.models.generate_content(
-                    model='gemini-2.0-flash-exp',
-                    contents=continuation_prompt
-                )
-                st.session_state.guided_history.append({"role": "assistant", "content": response.text})
-                st.rerun()
+                # The chat session carries the conversation server-side, so
+                # only the new student response is sent each turn.
+                stream = st.session_state.guided_chat.send_message_stream(user_response)
+                with st.chat_message("assistant"):
+                    full_text = st.write_stream(chunk.text for chunk in stream if chunk.text)
+                st.session_state.guided_history.append({"role": "assistant", "content": full_text})
             except Exception as e:
                 st.error(f"Error generating response: {str(e)}")
 
@@ -161,7 +212,7 @@ Continue as a Socratic tutor. Based on the student's response:
 def practice_tests():
     """Practice Tests mode - Quiz generator."""
     st.header("📝 Practice Tests")
-    st.markdown("Generate quizzes to test your knowledge on any topic.")
+    st.markdown(PRACTICE_INTRO)
     
     if not st.session_state.client:
         st.error("Client is not initialized. Please enter a valid API key to continue.")
@@ -172,64 +223,32 @@ def practice_tests():
     if st.button("Generate Quiz") and topic:
         st.session_state.quiz_submitted = False
         st.session_state.user_answers = {}
-        
-        quiz_prompt = f"""Generate exactly 5 multiple-choice questions about: {topic}
-
-Format your response EXACTLY as follows (use this exact format):
-
-Q1: [Question text]
-A) [Option A]
-B) [Option B]
-C) [Option C]
-D) [Option D]
-Correct: [A/B/C/D]
-Explanation: [Brief explanation]
-
-Q2: [Question text]
-A) [Option A]
-B) [Option B]
-C) [Option C]
-D) [Option D]
-Correct: [A/B/C/D]
-Explanation: [Brief explanation]
-
-Q3: [Question text]
-A) [Option A]
-B) [Option B]
-C) [Option C]
-D) [Option D]
-Correct: [A/B/C/D]
-Explanation: [Brief explanation]
-
-Q4: [Question text]
-A) [Option A]
-B) [Option B]
-C) [Option C]
-D) [Option D]
-Correct: [A/B/C/D]
-Explanation: [Brief explanation]
-
-Q5: [Question text]
-A) [Option A]
-B) [Option B]
-C) [Option C]
-D) [Option D]
-Correct: [A/B/C/D]
-Explanation: [Brief explanation]"""
-        
+
+        progress = st.empty()
+
+        def _show_progress(n):
+            progress.markdown(f"Generating question {n}/5…")
+
         try:
-            response = st.session_state.client.models.generate_content(
-                model='gemini-2.0-flash-exp',
-                contents=quiz_prompt
+            api_hash = hashlib.sha256(
+                st.session_state.api_key.encode()
+            ).hexdigest()[:16]
+            st.session_state.quiz_questions = _cached_quiz(
+                topic,
+                'gemini-2.0-flash-exp',
+                api_hash,
+                _client=st.session_state.client,
+                _on_progress=_show_progress,
             )
-            st.session_state.quiz_questions = parse_quiz(response.text)
         except Exception as e:
             st.error(f"Error generating quiz: {str(e)}")
-    
+        finally:
+            progress.empty()
+
     # Display quiz
     if st.session_state.quiz_questions:
         questions = st.session_state.quiz_questions
-        
+
         with st.form("quiz_form"):
             for i, q in enumerate(questions):
                 st.markdown(f"**Question {i+1}:** {q['question']}")
@@ -241,33 +260,33 @@ Explanation: [Brief explanation]"""
                     label_visibility="collapsed"
                 )
                 st.markdown("---")
-            
+
             submitted = st.form_submit_button("Submit Quiz")
-            
+
             if submitted:
                 st.session_state.quiz_submitted = True
-        
+
         # Show results after submission
         if st.session_state.quiz_submitted:
             st.markdown("## Results")
             score = 0
-            
+
             for i, q in enumerate(questions):
                 user_answer = st.session_state.user_answers.get(i, "")
                 user_letter = user_answer[0] if user_answer else ""
                 correct = user_letter == q['correct']
-                
+
                 if correct:
                     score += 1
                     st.success(f"**Q{i+1}:** ✅ Correct!")
                 else:
                     st.error(f"**Q{i+1}:** ❌ Incorrect. The correct answer is {q['correct']})")
-                
+
                 st.info(f"**Explanation:** {q['explanation']}")
                 st.markdown("---")
-            
+
             st.markdown(f"## Final Score: {score}/5")
-            
+
             if score == 5:
                 st.balloons()
                 st.success("Perfect score! Excellent work! 🎉")
@@ -277,99 +296,149 @@ Explanation: [Brief explanation]"""
                 st.warning("Keep studying and try again! 📚")
 
 
-def parse_quiz(quiz_text):
-    """Parse the quiz text into structured questions."""
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+def _cached_quiz(topic, model_name, api_key_hash, _client, _on_progress):
+    """Generate and parse a quiz, memoized per (topic, model, user key hash).
+
+    The underscore-prefixed arguments are excluded from the cache key; the
+    caller owns the progress element, so no UI is created inside the cached
+    body.
+    """
+    quiz_prompt = (
+        f"Generate exactly 5 multiple-choice questions about: {topic}\n\n"
+        "Format your response EXACTLY as follows (use this exact format):\n\n"
+        f"{_QUIZ_TEMPLATE_TAIL}"
+    )
+
+    stream = _client.models.generate_content_stream(
+        model=model_name,
+        contents=quiz_prompt,
+    )
+
+    # Parse question blocks as they complete in the stream instead of
+    # waiting for the full response.
+    _on_progress(1)
     questions = []
-    lines = quiz_text.strip().split('\n')
-    
-    current_question = {}
-    
-    for line in lines:
-        line = line.strip()
-        if not line:
+    text = ""
+    scanned = 0
+    for chunk in stream:
+        if not chunk.text:
             continue
-        
-        if line.startswith(('Q1:', 'Q2:', 'Q3:', 'Q4:', 'Q5:')):
-            if current_question and 'question' in current_question:
-                questions.append(current_question)
-            current_question = {'question': line.split(':', 1)[1].strip()}
-        elif line.startswith('A)'):
-            current_question['A'] = line[2:].strip()
-        elif line.startswith('B)'):
-            current_question['B'] = line[2:].strip()
-        elif line.startswith('C)'):
-            current_question['C'] = line[2:].strip()
-        elif line.startswith('D)'):
-            current_question['D'] = line[2:].strip()
-        elif line.startswith('Correct:'):
-            current_question['correct'] = line.split(':')[1].strip()
-        elif line.startswith('Explanation:'):
-            current_question['explanation'] = line.split(':', 1)[1].strip()
-    
-    if current_question and 'question' in current_question:
-        questions.append(current_question)
-    
-    # Ensure we have valid questions
-    valid_questions = []
-    for q in questions:
-        if all(key in q for key in ['question', 'A', 'B', 'C', 'D', 'correct', 'explanation']):
-            valid_questions.append(q)
-    
-    return valid_questions[:5]  # Return at most 5 questions
+        text += chunk.text
+        # A block is only final once the next question header has arrived;
+        # the lookahead would otherwise accept a truncated explanation.
+        for m in QUIZ_RE.finditer(text, scanned):
+            if text.find("\nQ", m.end()) == -1:
+                break
+            questions.append({key: value.strip() for key, value in m.groupdict().items()})
+            scanned = m.end()
+        _on_progress(min(len(questions) + 1, 5))
+    # The last block ends at end-of-text rather than at a header.
+    for m in QUIZ_RE.finditer(text, scanned):
+        questions.append({key: value.strip() for key, value in m.groupdict().items()})
+
+    if len(questions) < 5:
+        # Streamed completion parsed short; retry once with two candidates
+        # sharing a single prefill and keep whichever parses furthest.
+        response = _client.models.generate_content(
+            model=model_name,
+            contents=quiz_prompt,
+            config={'candidate_count': 2, 'temperature': 0.7},
+        )
+        for cand in response.candidates:
+            parsed = parse_quiz(cand.content.parts[0].text)
+            if len(parsed) == 5:
+                return parsed
+            if len(parsed) > len(questions):
+                questions = parsed
+
+    if len(questions) < 5:
+        # Raise rather than return a short quiz: st.cache_data does not
+        # memoize exceptions, so the next click retries instead of serving
+        # a broken result for the rest of the TTL.
+        raise ValueError(
+            f"Quiz generation produced only {len(questions)} of 5 questions. "
+            "Please try again."
+        )
+    return questions[:5]
+
+
+def parse_quiz(quiz_text):
+    """Parse the quiz text into structured questions."""
+    return [
+        {key: value.strip() for key, value in m.groupdict().items()}
+        for m in QUIZ_RE.finditer(quiz_text)
+    ][:5]  # Return at most 5 questions
 
 
 def free_chat():
     """Free Chat mode - Open-ended chat with Gemini."""
     st.header("💬 Free Chat")
-    st.markdown("Ask any question or discuss any topic with the AI.")
+    st.markdown(CHAT_INTRO)
     
     if not st.session_state.client:
         st.error("Client is not initialized. Please enter a valid API key to continue.")
         return
-    
-    # Display chat history
-    for message in st.session_state.chat_history:
-        if message["role"] == "user":
-            st.markdown(f"**👤 You:** {message['content']}")
-        else:
-            st.markdown(f"**🤖 AI:** {message['content']}")
-    
+
+    if st.sidebar.button("🗑️ Clear Chat"):
+        st.session_state.chat_history.clear()
+        st.session_state.chat_session = None
+        st.rerun()
+
+    _chat_conversation()
+
+
+@st.fragment
+def _chat_conversation():
+    """Conversation area for Free Chat; sends rerun only this fragment."""
+    _render_history(st.session_state.chat_history)
+
     # User input
-    user_input = st.text_input("Type your message:", key="chat_input")
-    
-    col1, col2 = st.columns([1, 5])
-    with col1:
-        send = st.button("Send")
-    with col2:
-        if st.button("Clear Chat"):
-            st.session_state.chat_history = []
-            st.rerun()
-    
-    if send and user_input:
+    if user_input := st.chat_input("Type your message:"):
         st.session_state.chat_history.append({"role": "user", "content": user_input})
-        
-        # Build conversation context
-        conversation = ""
-        for msg in st.session_state.chat_history[-10:]:  # Keep last 10 messages for context
-            role = "User" if msg["role"] == "user" else "Assistant"
-            conversation += f"{role}: {msg['content']}\n\n"
-        
-        prompt = f"""You are a helpful AI assistant. Continue the conversation naturally.
 
-{conversation}
-Assistant:"""
-        
+        with st.chat_message("user"):
+            st.markdown(user_input)
+
         try:
-            response = st.session_state.client.models.generate_content(
-                model='gemini-2.0-flash-exp',
-                contents=prompt
-            )
-            st.session_state.chat_history.append({"role": "assistant", "content": response.text})
-            st.rerun()
+            history = st.session_state.chat_history
+            # Once the deque is full the session would otherwise keep
+            # accumulating evicted turns server-side; rebuild it from the
+            # display window (minus the message about to be sent) so the
+            # model's context stays capped at what the user can see.
+            if st.session_state.chat_session is None or len(history) == history.maxlen:
+                st.session_state.chat_session = st.session_state.client.chats.create(
+                    model='gemini-2.0-flash-exp',
+                    config={
+                        'system_instruction': (
+                            "You are a helpful AI assistant. "
+                            "Continue the conversation naturally."
+                        )
+                    },
+                    history=[
+                        {
+                            'role': 'model' if m['role'] == 'assistant' else 'user',
+                            'parts': [{'text': m['content']}],
+                        }
+                        for m in list(history)[:-1]
+                    ],
+                )
+            stream = st.session_state.chat_session.send_message_stream(user_input)
+            with st.chat_message("assistant"):
+                full_text = st.write_stream(chunk.text for chunk in stream if chunk.text)
+            st.session_state.chat_history.append({"role": "assistant", "content": full_text})
         except Exception as e:
             st.error(f"Error generating response: {str(e)}")
 
 
+@st.fragment
+def _sidebar():
+    """Static sidebar branding; skipped when only other fragments rerun."""
+    st.sidebar.title("📚 AI Tutor")
+    st.sidebar.markdown("Your personalized AI study platform")
+    st.sidebar.markdown("---")
+
+
 def main():
     """Main application function."""
     init_session_state()
@@ -393,9 +462,7 @@ def main():
                 return
 
         # Sidebar navigation
-        st.sidebar.title("📚 AI Tutor")
-        st.sidebar.markdown("Your personalized AI study platform")
-        st.sidebar.markdown("---")
+        _sidebar()
         
         mode = st.sidebar.radio(
             "Select Mode:",
@@ -405,9 +472,11 @@ def main():
         st.sidebar.markdown("---")
         if st.sidebar.button("🚪 Logout"):
             st.session_state.authenticated = False
-            st.session_state.chat_history = []
+            st.session_state.chat_history.clear()
             st.session_state.guided_history = []
             st.session_state.guided_topic = ""
+            st.session_state.guided_chat = None
+            st.session_state.chat_session = None
             st.session_state.quiz_questions = None
             st.session_state.quiz_submitted = False
             st.session_state.user_answers = {}